@@ -0,0 +1,171 @@
+import os
+import sys
+import csv
+import json
+from peft import PeftModel
+from swift import Swift
+from infer_common import load_model, get_base_model_path, generate_batch_with_confidence
+from prepare_step3_final import FINAL_SYSTEM_PROMPT, detect_encoding, load_predicted_descs, site_name
+from step2_predict_desc import SYSTEM_PROMPT
+from step4_predict_classify import build_classify_query, parse_classify_response, LABEL_MARKER
+
+# ================= 配置区 =================
+# 多 checkpoint 对比：底座只加载一次，挂上多个 LoRA adapter，
+# 每个 batch 依次切换 adapter 推理，每个 checkpoint 输出一列 (贪心解码，结果可复现)，
+# 不用再改 ckpt_dir 反复重跑、反复加载 8B 底座。
+# classify 任务的输出列为 '标准分类@<checkpoint名>'，可直接交给 evaluate_predictions.py 评估。
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '0')  # 已在环境变量中指定时不覆盖
+
+# 1. 输出文件
+output_file = 'compare_checkpoints.jsonl'
+
+# 2. 每个 batch 的条数 (显存不够就调小)
+BATCH_SIZE = 16
+
+# 3. Step 2 补全文件 (classify 任务用来补充缺失的 Desc，不存在则忽略)
+STEP2_FILE = 'step2_predicted_desc_cleaned.jsonl'
+
+# 各任务的 System Prompt、输出列名与置信度起算标记
+TASKS = {
+    'desc': (SYSTEM_PROMPT, 'predicted_desc', 'predicted_desc_confidence', None),
+    'classify': (FINAL_SYSTEM_PROMPT, '标准分类', '标准分类_置信度', LABEL_MARKER),
+}
+
+
+def column_names(ckpt_dirs):
+    """列名用 checkpoint 目录名，重名时带上上级目录 (不同训练任务的同号 checkpoint)"""
+    names = [os.path.basename(c.rstrip('/')) for c in ckpt_dirs]
+    if len(set(names)) < len(names):
+        names = [os.path.join(os.path.basename(os.path.dirname(c.rstrip('/'))), n)
+                 for c, n in zip(ckpt_dirs, names)]
+    return names
+
+
+def attach_adapters(model, ckpt_dirs):
+    """在同一个底座上挂载多个 adapter，返回 (模型, adapter 名列表)"""
+    adapter_names = [f"ckpt_{i}" for i in range(len(ckpt_dirs))]
+    for i, (ckpt, name) in enumerate(zip(ckpt_dirs, adapter_names)):
+        print(f"正在挂载 adapter [{name}]: {ckpt}")
+        if i > 0 and isinstance(model, PeftModel):
+            # peft 格式：第一个 adapter 挂上后模型变成 PeftModel，后续直接追加
+            model.load_adapter(ckpt, adapter_name=name)
+        else:
+            model = Swift.from_pretrained(model, ckpt, adapter_name=name, inference_mode=True)
+    return model, adapter_names
+
+
+def activate_adapter(model, name):
+    if hasattr(model, 'set_adapter'):
+        model.set_adapter(name)
+    else:
+        model.set_active_adapters([name])
+
+
+def load_desc_inputs(input_file):
+    """Step 2 输入 (query 或 raw_data)"""
+    entries = []
+    with open(input_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip(): continue
+            try:
+                entry = json.loads(line)
+            except:
+                continue
+            if 'query' not in entry:
+                if 'raw_data' not in entry:
+                    continue
+                uri = entry['raw_data'].get('uri', '').strip()
+                name = entry['raw_data'].get('name', '').strip()
+                entry['query'] = f"tablename:{uri}; colname:{name}"
+            entries.append(entry)
+    return entries
+
+
+def load_classify_inputs(csv_file):
+    """原始 CSV，按 Step 3 双模态格式构造 query"""
+    predicted_map = load_predicted_descs(STEP2_FILE) if os.path.exists(STEP2_FILE) else {}
+    encoding = detect_encoding(csv_file)
+    with open(csv_file, 'r', encoding=encoding, newline='') as f:
+        rows = list(csv.DictReader(f, delimiter=','))
+    site = site_name(csv_file)
+    return [{"query": build_classify_query(row, predicted_map), "raw_data": row, "site": site} for row in rows]
+
+
+def compare(task, input_file, ckpt_dirs):
+    if task not in TASKS:
+        print(f"错误: 未知任务 {task}，可选: {', '.join(TASKS)}")
+        return
+    if not os.path.exists(input_file):
+        print(f"错误: 找不到输入文件 {input_file}")
+        return
+    for ckpt in ckpt_dirs:
+        if not os.path.isdir(ckpt):
+            print(f"错误: 找不到 checkpoint 目录 {ckpt}")
+            return
+
+    system_prompt, field, conf_field, score_after = TASKS[task]
+    entries = load_desc_inputs(input_file) if task == 'desc' else load_classify_inputs(input_file)
+    total = len(entries)
+    print(f"任务: {task}，输入 {total} 条，对比 {len(ckpt_dirs)} 个 checkpoint")
+
+    # 1. 底座只加载一次 (各 checkpoint 应来自同一个底座)
+    base_model_path = get_base_model_path(ckpt_dirs[0])
+    model, tokenizer = load_model(None, base_model_path=base_model_path)
+    model, adapter_names = attach_adapters(model, ckpt_dirs)
+    columns = column_names(ckpt_dirs)
+    print("模型加载成功！开始推理...")
+
+    agree = {}
+    with open(output_file, 'w', encoding='utf-8') as f_out:
+        for start in range(0, total, BATCH_SIZE):
+            batch = entries[start:start + BATCH_SIZE]
+            queries = [entry['query'] for entry in batch]
+            outputs = {}
+
+            # 2. 每个 batch 依次切换 adapter
+            for name, column in zip(adapter_names, columns):
+                activate_adapter(model, name)
+                try:
+                    outputs[column] = generate_batch_with_confidence(
+                        model, tokenizer, system_prompt, queries, do_sample=False, score_after=score_after
+                    )
+                except Exception as e:
+                    print(f"Error batch {start} [{column}]: {e}")
+                    outputs[column] = [('', 0.0)] * len(batch)
+
+            for i, entry in enumerate(batch):
+                record = entry.copy()
+                answers = []
+                for column in columns:
+                    response, confidence = outputs[column][i]
+                    if task == 'classify':
+                        _, response = parse_classify_response(response)
+                    response = response.strip()
+                    record[f"{field}@{column}"] = response
+                    record[f"{conf_field}@{column}"] = round(confidence, 4)
+                    answers.append(response)
+                for a in range(len(columns)):
+                    for b in range(a + 1, len(columns)):
+                        agree[(a, b)] = agree.get((a, b), 0) + (answers[a] == answers[b])
+                f_out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f_out.flush()
+
+            print(f"[{min(start + BATCH_SIZE, total)}/{total}] " +
+                  " | ".join(f"{c}: {outputs[c][0][0].strip()[:30]}" for c in columns))
+
+    print("=" * 50)
+    print(f"完成！结果已保存在 {output_file}")
+    if total and len(columns) > 1:
+        print("checkpoint 两两输出一致率:")
+        for (a, b), count in agree.items():
+            print(f"    {columns[a]} vs {columns[b]}: {count / total:.1%}")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("使用方法: python compare_checkpoints.py <desc|classify> <输入文件> <checkpoint1> <checkpoint2> ...")
+        print("  desc    : 输入为 Step 2 的待补全 jsonl")
+        print("  classify: 输入为原始 CSV")
+    else:
+        compare(sys.argv[1], sys.argv[2], sys.argv[3:])
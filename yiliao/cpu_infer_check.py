@@ -0,0 +1,98 @@
+import os
+import sys
+import copy
+import time
+import torch
+from jsonl_index import JsonlIndex
+from infer_common import load_model, generate_response, quantize_for_cpu
+from step2_predict_desc import SYSTEM_PROMPT
+
+# ================= 配置区 =================
+# 校验 CPU int8 推理路径：同一批样本分别用 fp32 和 int8 贪心解码，
+# 比较输出一致率并统计 rows/s。
+# 平时可以用小模型 (如 Qwen3-0.6B) 快速跑基准，上线前再用真实 checkpoint 校验一致率。
+
+DEFAULT_SAMPLE_SIZE = 50
+CPU_THREADS = 16
+MAX_NEW_TOKENS = 32
+SEED = 42
+
+
+def load_queries(input_file, sample_size):
+    """从 Step 2 输入文件 (或任意带 query 的 jsonl) 中随机抽样，只读取被抽中的记录"""
+    queries = []
+    with JsonlIndex(input_file) as records:
+        for i in records.sample_indices(sample_size, seed=SEED):
+            try:
+                entry = records[i]
+            except ValueError:
+                continue
+            if 'query' in entry:
+                queries.append(entry['query'])
+            elif 'raw_data' in entry:
+                uri = entry['raw_data'].get('uri', '').strip()
+                name = entry['raw_data'].get('name', '').strip()
+                queries.append(f"tablename:{uri}; colname:{name}")
+    return queries
+
+
+def run_batch(model, tokenizer, queries):
+    outputs = []
+    start = time.perf_counter()
+    for query in queries:
+        response = generate_response(model, tokenizer, SYSTEM_PROMPT, query,
+                                     max_new_tokens=MAX_NEW_TOKENS, do_sample=False)
+        outputs.append(response.strip())
+    elapsed = time.perf_counter() - start
+    return outputs, elapsed
+
+
+def check(model_path, input_file, sample_size=DEFAULT_SAMPLE_SIZE):
+    if not os.path.exists(input_file):
+        print(f"错误: 找不到输入文件 {input_file}")
+        return
+
+    queries = load_queries(input_file, sample_size)
+    if not queries:
+        print("错误: 输入文件中没有可用的 query")
+        return
+    print(f"抽样 {len(queries)} 条用于校验")
+
+    # 目录里有 adapter_config.json 视为 LoRA checkpoint，否则当作普通模型目录
+    if os.path.exists(os.path.join(model_path, 'adapter_config.json')):
+        fp_model, tokenizer = load_model(model_path, device='cpu', cpu_threads=CPU_THREADS, quantize=False)
+    else:
+        fp_model, tokenizer = load_model(None, base_model_path=model_path, device='cpu',
+                                         cpu_threads=CPU_THREADS, quantize=False)
+    # fp32 模型还要用来对比，先拷贝一份再原地量化 (内存里同时只有两份)
+    int8_model = quantize_for_cpu(copy.deepcopy(fp_model))
+
+    print("正在运行 fp32 推理...")
+    fp_outputs, fp_time = run_batch(fp_model, tokenizer, queries)
+    print("正在运行 int8 推理...")
+    q_outputs, q_time = run_batch(int8_model, tokenizer, queries)
+
+    same = sum(1 for a, b in zip(fp_outputs, q_outputs) if a == b)
+    agreement = same / len(queries)
+
+    print("=" * 50)
+    print(f"线程数: {torch.get_num_threads()}")
+    print(f"fp32 : {len(queries) / fp_time:.2f} rows/s ({fp_time:.1f}s)")
+    print(f"int8 : {len(queries) / q_time:.2f} rows/s ({q_time:.1f}s)")
+    print(f"加速比: {fp_time / q_time:.2f}x")
+    print(f"输出一致率: {same}/{len(queries)} = {agreement:.1%}")
+    print("=" * 50)
+
+    diffs = [(q, a, b) for q, a, b in zip(queries, fp_outputs, q_outputs) if a != b]
+    for q, a, b in diffs[:5]:
+        print(f"[不一致] {q}\n    fp32: {a}\n    int8: {b}")
+    return agreement
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("使用方法: python cpu_infer_check.py <checkpoint或模型目录> <输入jsonl> [抽样数]")
+        print("示例: python cpu_infer_check.py /root/.cache/modelscope/hub/models/Qwen/Qwen3-0.6B combined.csvdescnull.json 20")
+    else:
+        n = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_SAMPLE_SIZE
+        check(sys.argv[1], sys.argv[2], n)
@@ -0,0 +1,275 @@
+import json
+import os
+import sys
+import tempfile
+import zlib
+
+import numpy as np
+
+# ================= 配置区 =================
+
+# 参与去重比较的字段 (system 对同一批数据都一样，不参与比较)
+DEDUP_FIELDS = ['query', 'response']
+
+# 默认相似度阈值 (估计 Jaccard >= 阈值 视为近似重复)
+DEFAULT_THRESHOLD = 0.8
+
+# MinHash 参数
+NUM_PERM = 128        # 哈希函数个数 (签名长度)
+SHINGLE_SIZE = 3      # 字符 n-gram 长度 (中文按字切，3 字一组)
+SEED = 42
+
+# 分块大小：签名写入磁盘 memmap，按块处理，内存占用与总样本数基本无关
+CHUNK_SIZE = 50000
+
+# 没有 type 字段的样本 (如 Step3 业务数据) 归入该类型
+DEFAULT_TYPE = '_default'
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def choose_bands(threshold, num_perm):
+    """
+    选取 LSH 分带参数 (bands, rows)，使 S 曲线拐点 (1/b)^(1/r) 最接近阈值
+    拐点略低于阈值即可，候选对最后还会用签名估计的 Jaccard 复核
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows != 0:
+            continue
+        bands = num_perm // rows
+        knee = (1.0 / bands) ** (1.0 / rows)
+        # 倾向于拐点在阈值下方，减少漏召
+        penalty = abs(knee - threshold) + (0.05 if knee > threshold else 0)
+        if best is None or penalty < best[0]:
+            best = (penalty, bands, rows)
+    return best[1], best[2]
+
+
+def sample_text(record):
+    """拼接参与比较的字段"""
+    parts = []
+    for field in DEDUP_FIELDS:
+        value = record.get(field, '')
+        if not isinstance(value, str):
+            value = json.dumps(value, ensure_ascii=False)
+        parts.append(value)
+    return '\n'.join(parts)
+
+
+def shingle_hashes(text):
+    """
+    字符 n-gram 哈希 (向量化)：把文本转成码点数组，滚动组合出每个 n-gram 的 32 位哈希
+    """
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < SHINGLE_SIZE:
+        return np.array([zlib.crc32(text.encode('utf-8'))], dtype=np.uint64)
+    n = len(codes) - SHINGLE_SIZE + 1
+    h = np.zeros(n, dtype=np.uint64)
+    for k in range(SHINGLE_SIZE):
+        h = (h * np.uint64(1000003) + codes[k:k + n]) & np.uint64(_MAX_HASH)
+    return np.unique(h)
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=SEED):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, 1 << 31, size=(num_perm, 1), dtype=np.int64).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=(num_perm, 1), dtype=np.int64).astype(np.uint64)
+
+    def signature(self, text):
+        h = shingle_hashes(text)[None, :]
+        # (a*x + b) mod p，a、x 都小于 2^32，乘积不会溢出 uint64
+        perm = ((self.a * h + self.b) % np.uint64(_MERSENNE_PRIME)) & np.uint64(_MAX_HASH)
+        return perm.min(axis=1).astype(np.uint32)
+
+
+def iter_records(file_path):
+    """逐行读取 JSONL，坏行返回 None 以保持行号对齐"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield line, json.loads(line)
+            except:
+                yield line, None
+
+
+def find(parent, x):
+    root = x
+    while parent[root] != root:
+        root = parent[root]
+    while parent[x] != root:
+        parent[x], x = root, parent[x]
+    return root
+
+
+def count_records(file_path):
+    """快速统计非空行数，用于预分配签名矩阵"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return sum(1 for line in f if line.strip())
+
+
+def build_signatures(input_file, hasher, sig_path):
+    """第一遍：计算签名写入磁盘 memmap，返回样本数和每条的字符数"""
+    total = count_records(input_file)
+    sigs = np.lib.format.open_memmap(sig_path, mode='w+', dtype=np.uint32, shape=(max(total, 1), NUM_PERM))
+    char_counts = np.zeros(total, dtype=np.int64)
+    for i, (line, record) in enumerate(iter_records(input_file)):
+        # 坏行按原始文本计算签名，写出时会被跳过
+        text = sample_text(record) if record is not None else line
+        sigs[i] = hasher.signature(text)
+        char_counts[i] = len(line)
+    sigs.flush()
+    del sigs
+    return total, char_counts
+
+
+def cluster_duplicates(sig_path, n, bands, rows, threshold):
+    """
+    LSH 分带：逐个 band 排序桶键，同桶样本与桶内第一个 (最早出现) 的样本做 Jaccard 复核，
+    通过的用并查集合并。签名留在磁盘上按块读取，内存里只有 O(n) 的桶键和并查集
+    """
+    sigs = np.load(sig_path, mmap_mode='r')
+    parent = list(range(n))
+    candidate_pairs = 0
+    verified_pairs = 0
+
+    for band in range(bands):
+        cols = slice(band * rows, (band + 1) * rows)
+        keys = np.empty(n, dtype=np.uint64)
+        for start in range(0, n, CHUNK_SIZE):
+            block = np.asarray(sigs[start:start + CHUNK_SIZE, cols]).astype(np.uint64)
+            # 按行多项式组合成 64 位桶键 (uint64 溢出即取模)
+            key = np.zeros(len(block), dtype=np.uint64)
+            for col in range(rows):
+                key = key * np.uint64(0x100000001B3) + block[:, col]
+            keys[start:start + len(block)] = key
+
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        is_head = np.ones(n, dtype=bool)
+        is_head[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        head_pos = np.maximum.accumulate(np.where(is_head, np.arange(n), 0))
+        members = np.nonzero(~is_head)[0]
+        if len(members) == 0:
+            continue
+        candidate_pairs += len(members)
+
+        for start in range(0, len(members), CHUNK_SIZE):
+            pos = members[start:start + CHUNK_SIZE]
+            a = order[head_pos[pos]]
+            b = order[pos]
+            sim = (np.asarray(sigs[a]) == np.asarray(sigs[b])).mean(axis=1)
+            passed = sim >= threshold
+            for x, y in zip(a[passed].tolist(), b[passed].tolist()):
+                rx, ry = find(parent, x), find(parent, y)
+                if rx != ry:
+                    # 始终保留下标更小 (更早出现) 的样本作为代表
+                    if rx < ry:
+                        parent[ry] = rx
+                    else:
+                        parent[rx] = ry
+                    verified_pairs += 1
+
+    del sigs
+    keep = np.array([find(parent, i) == i for i in range(n)], dtype=bool)
+    return keep, candidate_pairs, verified_pairs
+
+
+def parse_caps(args):
+    """解析 type=上限 形式的参数"""
+    caps = {}
+    for arg in args:
+        if '=' not in arg:
+            raise ValueError(f"上限参数格式应为 type=数量: {arg}")
+        key, value = arg.split('=', 1)
+        caps[key.strip()] = int(value)
+    return caps
+
+
+def dedup_dataset(input_file, threshold=DEFAULT_THRESHOLD, type_caps=None):
+    if not os.path.exists(input_file):
+        print(f"错误: 找不到输入文件 '{input_file}'")
+        return
+    type_caps = type_caps or {}
+
+    file_dir, file_name = os.path.split(input_file)
+    base_name = os.path.splitext(file_name)[0]
+    output_file = os.path.join(file_dir, f"{base_name}_dedup.jsonl")
+
+    bands, rows = choose_bands(threshold, NUM_PERM)
+    print(f"相似度阈值: {threshold}  (MinHash {NUM_PERM} 维, LSH {bands} 带 x {rows} 行)")
+
+    hasher = MinHasher()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sig_path = os.path.join(tmp_dir, 'signatures.npy')
+
+        # 1. 第一遍：计算签名
+        print("正在计算 MinHash 签名...")
+        total, char_counts = build_signatures(input_file, hasher, sig_path)
+        if total == 0:
+            print("错误: 输入文件为空。")
+            return
+        print(f"-> 共 {total} 条样本")
+
+        # 2. LSH 聚类
+        print("正在进行 LSH 分桶与复核...")
+        keep, candidate_pairs, verified_pairs = cluster_duplicates(sig_path, total, bands, rows, threshold)
+
+    # 3. 第二遍：写出保留样本，同时按类型限额
+    type_kept = {}
+    type_dropped_by_cap = {}
+    near_dup_removed = 0
+    cap_removed = 0
+    kept_chars = 0
+    with open(output_file, 'w', encoding='utf-8') as f_out:
+        for i, (line, record) in enumerate(iter_records(input_file)):
+            if record is None:
+                continue
+            if not keep[i]:
+                near_dup_removed += 1
+                continue
+            sample_type = record.get('type', DEFAULT_TYPE)
+            cap = type_caps.get(sample_type)
+            if cap is not None and type_kept.get(sample_type, 0) >= cap:
+                type_dropped_by_cap[sample_type] = type_dropped_by_cap.get(sample_type, 0) + 1
+                cap_removed += 1
+                continue
+            type_kept[sample_type] = type_kept.get(sample_type, 0) + 1
+            kept_chars += char_counts[i]
+            f_out.write(line if line.endswith('\n') else line + '\n')
+
+    kept_total = sum(type_kept.values())
+    total_chars = int(char_counts.sum())
+
+    print("=" * 50)
+    print("去重完成！")
+    print(f"原始样本: {total} 条")
+    print(f"LSH 候选对: {candidate_pairs}，复核通过并合并: {verified_pairs}")
+    print(f"近似重复删除: {near_dup_removed} 条")
+    print(f"超出类型上限删除: {cap_removed} 条")
+    for sample_type, count in sorted(type_dropped_by_cap.items()):
+        print(f"    {sample_type}: 删除 {count} 条 (上限 {type_caps[sample_type]})")
+    print(f"保留样本: {kept_total} 条")
+    for sample_type, count in sorted(type_kept.items()):
+        print(f"    {sample_type}: {count} 条")
+    # 训练算力与每轮处理的 token 数近似成正比，这里用字符数估算
+    saved_ratio = 1 - kept_chars / total_chars if total_chars else 0
+    print(f"训练数据量: {total_chars} -> {kept_chars} 字符")
+    print(f"预计每个 epoch 节省训练算力约 {saved_ratio:.1%} (按字符数估算)")
+    print(f"输出文件: {output_file}")
+    print("=" * 50)
+    return output_file
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("\n参数错误。用法:")
+        print("python dedup_dataset.py <jsonl文件路径> [相似度阈值] [type=上限 ...]")
+        print("示例: python dedup_dataset.py standard_target_9000.jsonl 0.8 standard_path=1000 standard_multiple_choice=2000")
+    else:
+        threshold = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_THRESHOLD
+        dedup_dataset(sys.argv[1], threshold, parse_caps(sys.argv[3:]))
@@ -0,0 +1,325 @@
+import csv
+import json
+import os
+import re
+import sys
+import numpy as np
+from prepare_step3_final import detect_encoding, site_name
+
+# ================= 配置区 =================
+# 用导出 CSV 里的 personalSign / businessSign 作为真值，评估分类预测结果：
+# 整体精确匹配率、按 '-' 层级的层次化 P/R/F1，以及按站点 / dbType 的分组结果。
+# 计算在「唯一的 (预测, 真值) 组合」上向量化完成，再按出现次数展开到行，百万行也只需几秒。
+
+# 预测列：'标准分类' 以及多 checkpoint 对比时的 '标准分类@<checkpoint名>'
+PRED_FIELD = '标准分类'
+
+# 分组结果里只展示样本数不少于该值的组
+MIN_GROUP_SIZE = 20
+
+LABEL_SEP = re.compile(r'[;；]')
+
+
+def normalize_labels(value):
+    """多标签字符串 -> 去重排序后的规范形式，用于精确匹配"""
+    labels = sorted(set(v.strip() for v in LABEL_SEP.split(value or '') if v.strip()))
+    return ';'.join(labels)
+
+
+def ground_truth(row):
+    """与 Step 3 训练时一致：优先 personalSign，没有则用 businessSign"""
+    p_sign = (row.get('personalSign') or '').strip()
+    b_sign = (row.get('businessSign') or '').strip()
+    return p_sign if p_sign else b_sign
+
+
+def query_key_of(record):
+    raw = record.get('raw_data')
+    if raw:
+        return f"tablename:{raw.get('uri', '').strip()}; colname:{raw.get('name', '').strip()}"
+    # query 可能带 '; Desc:xxx' 后缀
+    return record.get('query', '').split('; Desc:')[0].strip()
+
+
+def load_label_csvs(csv_files):
+    """
+    (站点, query_key) -> (真值, dbType)
+    同一个 query_key 可能出现在多个 CSV 中 (如全量导出 quanbu 与各站点导出重叠)，
+    因此按站点分别保存，预测记录用自己的 site 去查
+    """
+    mapping = {}
+    for csv_file in csv_files:
+        if not os.path.exists(csv_file):
+            print(f"警告: 找不到文件 {csv_file}，跳过")
+            continue
+        site = site_name(csv_file)
+        encoding = detect_encoding(csv_file)
+        with open(csv_file, 'r', encoding=encoding, newline='') as f:
+            for row in csv.DictReader(f, delimiter=','):
+                truth = ground_truth(row)
+                if not truth:
+                    continue
+                key = f"tablename:{row.get('uri', '').strip()}; colname:{row.get('name', '').strip()}"
+                mapping[(site, key)] = (truth, (row.get('dbType') or '').strip())
+    return mapping
+
+
+def index_by_key(label_map):
+    """
+    给没有 site 字段 (或 site 不在传入 CSV 中) 的预测记录兜底：query_key -> (真值, dbType, 站点)
+    重复的 key 取先传入的 CSV；返回真值互相冲突的 key 集合，便于提示
+    """
+    by_key, conflicts = {}, set()
+    for (site, key), (truth, db_type) in label_map.items():
+        if key not in by_key:
+            by_key[key] = (truth, db_type, site)
+        elif normalize_labels(by_key[key][0]) != normalize_labels(truth):
+            conflicts.add(key)
+    return by_key, conflicts
+
+
+def load_predictions(pred_file, label_map):
+    """
+    读取预测文件并与真值关联
+    返回 {预测列: 预测数组}, 真值数组, 站点数组, dbType 数组, 未匹配条数
+    """
+    preds = {}
+    truths, sites, db_types = [], [], []
+    unmatched = 0
+    missing_site = 0
+    by_key, conflicts = index_by_key(label_map)
+    conflict_hits = 0
+    with open(pred_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip(): continue
+            try:
+                record = json.loads(line)
+            except:
+                continue
+
+            if label_map:
+                key = query_key_of(record)
+                site = record.get('site')
+                hit = label_map.get((site, key))
+                if hit is not None:
+                    truth, db_type = hit
+                else:
+                    # 记录没有 site，或其站点的 CSV 没有传入：按 key 兜底
+                    hit = by_key.get(key)
+                    if hit is None:
+                        unmatched += 1
+                        continue
+                    truth, db_type, csv_site = hit
+                    site = site or csv_site
+                    conflict_hits += key in conflicts
+            else:
+                raw = record.get('raw_data', {})
+                truth = ground_truth(raw)
+                if not truth:
+                    unmatched += 1
+                    continue
+                db_type = (raw.get('dbType') or '').strip()
+                # step4 / 整表分类 / 多 checkpoint 对比会记录来源 CSV 的站点
+                site = record.get('site')
+                if not site:
+                    missing_site += 1
+                    site = '(未知站点)'
+
+            idx = len(truths)
+            for field, value in record.items():
+                if field == PRED_FIELD or field.startswith(PRED_FIELD + '@'):
+                    if field not in preds:
+                        # 新出现的预测列，之前的行补空
+                        preds[field] = [''] * idx
+                    preds[field].append(normalize_labels(value))
+            for values in preds.values():
+                if len(values) == idx:
+                    values.append('')
+            truths.append(normalize_labels(truth))
+            sites.append(site)
+            db_types.append(db_type or '(空)')
+
+    if conflict_hits:
+        print(f"警告: {conflict_hits} 条预测未能按站点关联，而其 key 在多个 CSV 中真值不一致，"
+              f"已取先传入的 CSV 的真值；请确认预测记录带有正确的 site 字段")
+    if missing_site:
+        print(f"警告: {missing_site} 条预测没有 site 字段，按站点统计归入 '(未知站点)'；"
+              f"可传入带标签的 CSV 重新关联站点")
+    preds = {k: np.array(v, dtype=object) for k, v in preds.items()}
+    return preds, np.array(truths, dtype=object), np.array(sites, dtype=object), np.array(db_types, dtype=object), unmatched
+
+
+def factorize(values):
+    """值 -> (唯一值列表, 逆索引数组)，哈希实现，比对象数组排序快得多"""
+    index = {}
+    inv = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64, count=len(values))
+    return list(index), inv
+
+
+def encode_paths(labels):
+    """
+    路径 -> 层级编码矩阵 codes[i, l] = 前 l+1 段前缀的 ID (路径更短则为 -1)
+    两条路径在第 l 层一致 <=> codes 在第 l 列相等且非负
+    """
+    split = [label.split('-') for label in labels]
+    depth = max((len(p) for p in split), default=1)
+    codes = np.full((len(labels), depth), -1, dtype=np.int64)
+    vocab = {}
+    for i, parts in enumerate(split):
+        for l in range(len(parts)):
+            codes[i, l] = vocab.setdefault('-'.join(parts[:l + 1]), len(vocab))
+    return codes
+
+
+def score_combos(pred_labels, true_labels):
+    """
+    对每个唯一 (预测, 真值) 组合，在多标签两两配对中选公共前缀最深的一对，
+    返回 (公共深度, 预测深度, 真值深度, 是否精确匹配)，全部为长度 = 组合数的数组
+    """
+    n = len(pred_labels)
+    pair_combo, pair_pred, pair_true = [], [], []
+    for i in range(n):
+        p_list = pred_labels[i].split(';') if pred_labels[i] else ['']
+        t_list = true_labels[i].split(';')
+        for p in p_list:
+            for t in t_list:
+                pair_combo.append(i)
+                pair_pred.append(p)
+                pair_true.append(t)
+
+    uniq, inv = factorize(pair_pred + pair_true)
+    codes = encode_paths(uniq)
+    # 空预测 (解析失败) 不算到达任何层级
+    codes[np.array([u == '' for u in uniq]), :] = -1
+    m = len(pair_combo)
+    p_codes = codes[inv[:m]]
+    t_codes = codes[inv[m:]]
+
+    same = (p_codes == t_codes) & (p_codes >= 0)
+    common = np.cumprod(same, axis=1).sum(axis=1)
+    p_depth = (p_codes >= 0).sum(axis=1)
+    t_depth = (t_codes >= 0).sum(axis=1)
+
+    # 每个组合取公共深度最大的一对 (并列时取预测更短的，避免奖励过深的猜测)
+    pair_combo = np.array(pair_combo)
+    order = np.lexsort((p_depth, -common, pair_combo))
+    first = np.ones(m, dtype=bool)
+    first[1:] = pair_combo[order][1:] != pair_combo[order][:-1]
+    best = order[first]
+
+    exact = np.array([p == t for p, t in zip(pred_labels, true_labels)])
+    return common[best], p_depth[best], t_depth[best], exact
+
+
+def score_rows(pred, truth):
+    """逐行结果：在唯一组合上打分，再用逆索引展开"""
+    combos, inv = factorize(list(zip(pred.tolist(), truth.tolist())))
+    common, p_depth, t_depth, exact = score_combos([c[0] for c in combos], [c[1] for c in combos])
+    return common[inv], p_depth[inv], t_depth[inv], exact[inv]
+
+
+def level_metrics(common, p_depth, t_depth, max_level):
+    """第 l 层: P = 预测到达 l 层且前 l 层都对 / 预测到达 l 层；R = 同分子 / 真值到达 l 层"""
+    levels = np.arange(1, max_level + 1)[:, None]
+    correct = (common[None, :] >= levels).sum(axis=1)
+    pred_n = (p_depth[None, :] >= levels).sum(axis=1)
+    true_n = (t_depth[None, :] >= levels).sum(axis=1)
+    precision = np.divide(correct, pred_n, out=np.zeros(len(levels)), where=pred_n > 0)
+    recall = np.divide(correct, true_n, out=np.zeros(len(levels)), where=true_n > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall,
+                   out=np.zeros(len(levels)), where=(precision + recall) > 0)
+    return precision, recall, f1
+
+
+def summarize(common, p_depth, t_depth, exact):
+    h_p = common.sum() / max(p_depth.sum(), 1)
+    h_r = common.sum() / max(t_depth.sum(), 1)
+    h_f = 2 * h_p * h_r / (h_p + h_r) if h_p + h_r else 0.0
+    return {
+        "n": int(len(exact)),
+        "exact_match": float(exact.mean()) if len(exact) else 0.0,
+        "hier_precision": float(h_p),
+        "hier_recall": float(h_r),
+        "hier_f1": float(h_f),
+    }
+
+
+def group_report(keys, common, p_depth, t_depth, exact):
+    """按组聚合 (bincount)，返回 [(组名, 指标)]"""
+    names, inv = factorize(keys.tolist())
+    n = np.bincount(inv)
+    exact_n = np.bincount(inv, weights=exact)
+    common_s = np.bincount(inv, weights=common)
+    p_s = np.bincount(inv, weights=p_depth)
+    t_s = np.bincount(inv, weights=t_depth)
+    rows = []
+    for i, name in enumerate(names):
+        h_p = common_s[i] / p_s[i] if p_s[i] else 0.0
+        h_r = common_s[i] / t_s[i] if t_s[i] else 0.0
+        h_f = 2 * h_p * h_r / (h_p + h_r) if h_p + h_r else 0.0
+        rows.append((name, {"n": int(n[i]), "exact_match": exact_n[i] / n[i], "hier_f1": h_f}))
+    rows.sort(key=lambda x: -x[1]['n'])
+    return rows
+
+
+def evaluate(pred_file, csv_files):
+    if not os.path.exists(pred_file):
+        print(f"错误: 找不到预测文件 {pred_file}")
+        return
+
+    label_map = load_label_csvs(csv_files) if csv_files else {}
+    if csv_files:
+        print(f"-> 从 {len(csv_files)} 个 CSV 加载了 {len(label_map)} 条真值")
+
+    preds, truths, sites, db_types, unmatched = load_predictions(pred_file, label_map)
+    if len(truths) == 0:
+        print("错误: 没有可评估的数据 (预测文件缺少真值，或与 CSV 关联不上)")
+        return
+    if not preds:
+        print(f"错误: 预测文件中没有 '{PRED_FIELD}' 列")
+        return
+    print(f"-> 参与评估: {len(truths)} 条，未关联到真值: {unmatched} 条")
+
+    report = {}
+    for field, pred in sorted(preds.items()):
+        common, p_depth, t_depth, exact = score_rows(pred, truths)
+        max_level = int(max(p_depth.max(), t_depth.max()))
+        precision, recall, f1 = level_metrics(common, p_depth, t_depth, max_level)
+        summary = summarize(common, p_depth, t_depth, exact)
+        summary['levels'] = [
+            {"level": l + 1, "precision": float(precision[l]), "recall": float(recall[l]), "f1": float(f1[l])}
+            for l in range(max_level)
+        ]
+        summary['by_site'] = {k: v for k, v in group_report(sites, common, p_depth, t_depth, exact)}
+        summary['by_dbType'] = {k: v for k, v in group_report(db_types, common, p_depth, t_depth, exact)}
+        report[field] = summary
+
+        print("=" * 60)
+        print(f"[{field}]")
+        print(f"精确匹配率: {summary['exact_match']:.2%}")
+        print(f"层次化 P/R/F1: {summary['hier_precision']:.2%} / {summary['hier_recall']:.2%} / {summary['hier_f1']:.2%}")
+        print("分层指标:")
+        for lv in summary['levels']:
+            print(f"    L{lv['level']}: P={lv['precision']:.2%}  R={lv['recall']:.2%}  F1={lv['f1']:.2%}")
+        for title, key in (("按站点", 'by_site'), ("按 dbType", 'by_dbType')):
+            print(f"{title}:")
+            for name, m in summary[key].items():
+                if m['n'] < MIN_GROUP_SIZE:
+                    continue
+                print(f"    {name:<28} n={m['n']:<7} 精确匹配={m['exact_match']:.2%}  层次F1={m['hier_f1']:.2%}")
+
+    file_dir, file_name = os.path.split(pred_file)
+    report_file = os.path.join(file_dir, f"{os.path.splitext(file_name)[0]}_eval.json")
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print("=" * 60)
+    print(f"评估报告已保存: {report_file}")
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("使用方法: python evaluate_predictions.py <预测jsonl> [带标签的CSV ...]")
+        print("不传 CSV 时直接使用预测记录 raw_data 中的 personalSign / businessSign")
+    else:
+        evaluate(sys.argv[1], sys.argv[2:])
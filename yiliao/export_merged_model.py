@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import subprocess
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from swift import Swift
+from infer_common import get_base_model_path, is_merged_model, merge_lora, MERGED_MANIFEST
+
+# ================= 配置区 =================
+# 把 checkpoint 的 LoRA 合并进底座，导出为独立的 safetensors 模型目录。
+# 推理脚本的 ckpt_dir 直接指向导出目录即可，加载时不再需要底座和 Swift，
+# 省去挂载 / 合并 LoRA 的步骤 (权重仍在加载时全部读入内存)。
+# 冷启动实际快多少用 bench 子命令在部署机器上测量。
+
+# 导出精度，与 GPU 推理路径保持一致
+EXPORT_DTYPE = torch.float16
+
+# 单个 safetensors 分片大小
+MAX_SHARD_SIZE = '4GB'
+
+# bench 轮数：两种加载方式交替运行，减少系统页缓存对先后顺序的影响
+BENCH_ROUNDS = 2
+
+
+def file_sha256(path, chunk_size=16 * 1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_dir(dir_path, skip=()):
+    """记录目录下每个文件的大小和 sha256"""
+    files = {}
+    for name in sorted(os.listdir(dir_path)):
+        path = os.path.join(dir_path, name)
+        if name in skip or not os.path.isfile(path):
+            continue
+        files[name] = {"size": os.path.getsize(path), "sha256": file_sha256(path)}
+    return files
+
+
+def export_merged(ckpt_dir, output_dir=None):
+    if not os.path.isdir(ckpt_dir):
+        print(f"错误: 找不到 checkpoint 目录 {ckpt_dir}")
+        return
+
+    ckpt_dir = os.path.abspath(ckpt_dir)
+    if output_dir is None:
+        output_dir = ckpt_dir.rstrip('/') + '-merged'
+    if os.path.exists(os.path.join(output_dir, MERGED_MANIFEST)):
+        print(f"错误: 输出目录已存在合并模型 {output_dir}，请先删除或换一个目录")
+        return
+
+    base_model_path = get_base_model_path(ckpt_dir)
+    print(f"底座模型: {base_model_path}")
+    print(f"LoRA 权重: {ckpt_dir}")
+
+    start_time = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(base_model_path, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(
+        base_model_path,
+        torch_dtype=EXPORT_DTYPE,
+        low_cpu_mem_usage=True,
+        trust_remote_code=True
+    )
+    model = Swift.from_pretrained(model, ckpt_dir, inference_mode=True)
+    print("正在合并 LoRA 权重...")
+    model = merge_lora(model)
+
+    print(f"正在写出合并模型: {output_dir}")
+    os.makedirs(output_dir, exist_ok=True)
+    model.save_pretrained(output_dir, safe_serialization=True, max_shard_size=MAX_SHARD_SIZE)
+    tokenizer.save_pretrained(output_dir)
+
+    print("正在计算文件哈希...")
+    manifest = {
+        "source_checkpoint": ckpt_dir,
+        "base_model": base_model_path,
+        "dtype": str(EXPORT_DTYPE).replace('torch.', ''),
+        "exported_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "source_files": hash_dir(ckpt_dir),
+        "files": hash_dir(output_dir, skip=(MERGED_MANIFEST,))
+    }
+    with open(os.path.join(output_dir, MERGED_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    total_size = sum(info['size'] for info in manifest['files'].values())
+    print("=" * 50)
+    print("导出完成！")
+    print(f"输出目录: {output_dir}")
+    print(f"文件数: {len(manifest['files'])}，总大小: {total_size / 1024 ** 3:.2f} GB")
+    print(f"耗时: {time.perf_counter() - start_time:.1f}s")
+    print("使用方法: 把推理脚本里的 ckpt_dir 改成上面的输出目录")
+    print("=" * 50)
+    return output_dir
+
+
+def verify_merged(output_dir):
+    """按清单完整校验合并模型文件的 sha256"""
+    manifest_path = os.path.join(output_dir, MERGED_MANIFEST)
+    if not os.path.exists(manifest_path):
+        print(f"错误: {output_dir} 不是合并模型目录 (缺少 {MERGED_MANIFEST})")
+        return False
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    ok = True
+    for name, info in manifest['files'].items():
+        path = os.path.join(output_dir, name)
+        if not os.path.exists(path):
+            print(f"[缺失] {name}")
+            ok = False
+        elif file_sha256(path) != info['sha256']:
+            print(f"[不一致] {name}")
+            ok = False
+    print(f"来源 checkpoint: {manifest['source_checkpoint']}")
+    print("校验通过" if ok else "校验失败")
+    return ok
+
+
+def time_load(model_dir, device):
+    """在独立子进程里调用 load_model，返回冷启动秒数 (进程退出即释放内存，互不影响)"""
+    code = (
+        "import sys, time\n"
+        "from infer_common import load_model\n"
+        "start = time.perf_counter()\n"
+        "load_model(sys.argv[1], device=sys.argv[2])\n"
+        "print('BENCH_SECONDS', time.perf_counter() - start)\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code, model_dir, device],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith('BENCH_SECONDS'):
+            return float(line.split()[1])
+    print(result.stdout[-2000:])
+    print(result.stderr[-2000:])
+    return None
+
+
+def bench_cold_start(ckpt_dir, merged_dir, device='cpu'):
+    """对比 底座 + LoRA checkpoint 与合并模型的冷启动耗时"""
+    if not is_merged_model(merged_dir):
+        print(f"错误: {merged_dir} 不是合并模型目录 (缺少 {MERGED_MANIFEST})")
+        return
+    results = {'底座 + LoRA': [], '合并模型': []}
+    for round_id in range(BENCH_ROUNDS):
+        for label, model_dir in (('底座 + LoRA', ckpt_dir), ('合并模型', merged_dir)):
+            seconds = time_load(model_dir, device)
+            print(f"[第 {round_id + 1} 轮] {label}: " + (f"{seconds:.1f}s" if seconds is not None else "加载失败"))
+            if seconds is not None:
+                results[label].append(seconds)
+
+    print("=" * 50)
+    print(f"推理设备: {device}")
+    for label, times in results.items():
+        if times:
+            print(f"{label:<10} 最快 {min(times):.1f}s  各轮: {', '.join(f'{t:.1f}s' for t in times)}")
+    if results['底座 + LoRA'] and results['合并模型']:
+        print(f"加速比: {min(results['底座 + LoRA']) / min(results['合并模型']):.2f}x")
+    print("=" * 50)
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == 'verify':
+        verify_merged(sys.argv[2])
+    elif len(sys.argv) >= 4 and sys.argv[1] == 'bench':
+        bench_cold_start(sys.argv[2], sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else 'cpu')
+    elif len(sys.argv) >= 2 and sys.argv[1] not in ('verify', 'bench'):
+        export_merged(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        print("使用方法:")
+        print("  导出: python export_merged_model.py <checkpoint目录> [输出目录]")
+        print("  校验: python export_merged_model.py verify <合并模型目录>")
+        print("  测速: python export_merged_model.py bench <checkpoint目录> <合并模型目录> [cpu|cuda]")
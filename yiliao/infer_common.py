@@ -0,0 +1,306 @@
+import os
+import json
+import math
+import re
+import time
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from swift import Swift
+
+# ================= 配置区 =================
+
+# 推理设备默认值: 'cuda' 或 'cpu'
+DEFAULT_DEVICE = 'cuda'
+
+# CPU 推理线程数 (None 表示使用 torch 默认值，一般等于物理核数)
+DEFAULT_CPU_THREADS = None
+
+
+# ModelScope 默认缓存目录，args.json 里记录的是模型 ID 时优先在这里找本地副本
+MODELSCOPE_CACHE = os.path.expanduser('~/.cache/modelscope/hub/models')
+DEFAULT_BASE_MODEL = 'Qwen/Qwen3-8B'
+
+# export_merged_model.py 导出的合并模型目录中的清单文件名
+MERGED_MANIFEST = 'merge_manifest.json'
+
+
+def resolve_model_path(model_id):
+    """模型 ID 转本地路径：已是目录直接用，其次查 ModelScope 缓存，都没有则原样返回交给 from_pretrained"""
+    if os.path.isdir(model_id):
+        return model_id
+    cached = os.path.join(MODELSCOPE_CACHE, model_id)
+    if os.path.isdir(cached):
+        return cached
+    return model_id
+
+
+def get_base_model_path(ckpt_dir):
+    """从 args.json 中读取底座模型路径，环境变量 BASE_MODEL_PATH 可强制指定"""
+    if os.environ.get('BASE_MODEL_PATH'):
+        return os.environ['BASE_MODEL_PATH']
+
+    args_path = os.path.join(ckpt_dir, 'sft_args.json')
+    if not os.path.exists(args_path):
+        # 兼容新版文件名为 args.json
+        args_path = os.path.join(ckpt_dir, 'args.json')
+
+    model_id = DEFAULT_BASE_MODEL # 保底默认值
+    if os.path.exists(args_path):
+        with open(args_path, 'r') as f:
+            args = json.load(f)
+            # 优先尝试读取 model_id_or_path，如果没有则尝试 model
+            model_id = args.get('model_id_or_path') or args.get('model') or DEFAULT_BASE_MODEL
+    return resolve_model_path(model_id)
+
+
+def is_merged_model(model_dir):
+    """是否为 export_merged_model.py 导出的合并模型 (无需再挂 LoRA)"""
+    return bool(model_dir) and os.path.exists(os.path.join(model_dir, MERGED_MANIFEST))
+
+
+def check_merged_manifest(model_dir):
+    """快速校验：只比对清单里记录的文件大小，完整哈希校验见 export_merged_model.py verify"""
+    with open(os.path.join(model_dir, MERGED_MANIFEST), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    for name, info in manifest.get('files', {}).items():
+        path = os.path.join(model_dir, name)
+        if not os.path.exists(path) or os.path.getsize(path) != info['size']:
+            print(f"警告: 合并模型文件 {name} 与清单不符，可能已损坏或被修改")
+    print(f"合并模型来源 checkpoint: {manifest.get('source_checkpoint')}")
+    return manifest
+
+
+def merge_lora(model):
+    """把 LoRA 权重合并进底座线性层，返回不带 adapter 包装的普通模型"""
+    if hasattr(model, 'merge_and_unload'):
+        # peft 格式的 checkpoint，Swift.from_pretrained 返回的是 PeftModel
+        return model.merge_and_unload()
+    Swift.merge_and_unload(model)
+    return getattr(model, 'model', model)
+
+
+def quantize_for_cpu(model):
+    """
+    线性层做 int8 动态量化 (权重 int8，激活运行时量化)，只适用于 CPU
+    原地替换模块，避免 quantize_dynamic 默认深拷贝整个 fp32 模型导致内存峰值翻倍
+    """
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def load_model(ckpt_dir, base_model_path=None, device=DEFAULT_DEVICE,
+               cpu_threads=DEFAULT_CPU_THREADS, quantize=True):
+    """
+    加载底座 + LoRA
+    - device='cuda': 与原来一致，fp16 + device_map=auto，LoRA 以 adapter 形式挂载
+    - device='cpu' : fp32 加载，LoRA 合并进权重，再对线性层做 int8 动态量化
+    ckpt_dir 为 None 时只加载底座 (用于小模型基准测试)
+    ckpt_dir 为合并模型目录时直接加载，省去底座 + LoRA 的挂载与合并步骤；
+    权重仍会在加载时全部读入内存 (CPU 路径还会转成 fp32 再量化)，并非按需读取，
+    实际节省的冷启动时间用 export_merged_model.py bench 测量
+    """
+    start_time = time.perf_counter()
+    if is_merged_model(ckpt_dir):
+        check_merged_manifest(ckpt_dir)
+        base_model_path = ckpt_dir
+        ckpt_dir = None
+        print(f"检测到合并模型: {base_model_path}")
+    else:
+        if base_model_path is None:
+            base_model_path = get_base_model_path(ckpt_dir)
+        print(f"检测到底座模型: {base_model_path}")
+
+    tokenizer = AutoTokenizer.from_pretrained(
+        base_model_path,
+        trust_remote_code=True
+    )
+
+    if device == 'cpu':
+        if cpu_threads:
+            torch.set_num_threads(cpu_threads)
+        print(f"推理设备: CPU (线程数 {torch.get_num_threads()}, int8 量化: {'开' if quantize else '关'})")
+        model = AutoModelForCausalLM.from_pretrained(
+            base_model_path,
+            torch_dtype=torch.float32, # CPU 上 fp16 算子不全且慢，用 fp32 再量化
+            low_cpu_mem_usage=True,
+            trust_remote_code=True
+        )
+        if ckpt_dir:
+            print(f"正在加载并合并 LoRA 权重: {ckpt_dir}")
+            model = Swift.from_pretrained(model, ckpt_dir, inference_mode=True)
+            model = merge_lora(model)
+        model.eval()
+        if quantize:
+            model = quantize_for_cpu(model)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(
+            base_model_path,
+            device_map="auto",
+            torch_dtype=torch.float16, # 显存不够可改为 bfloat16 或 load_in_8bit=True
+            low_cpu_mem_usage=True,
+            trust_remote_code=True
+        )
+        if ckpt_dir:
+            print(f"正在加载 LoRA 权重: {ckpt_dir}")
+            model = Swift.from_pretrained(model, ckpt_dir, inference_mode=True)
+
+    print(f"冷启动耗时: {time.perf_counter() - start_time:.1f}s")
+    return model, tokenizer
+
+
+def sequence_confidence(token_logprobs):
+    """序列级置信度：token 平均对数概率取指数 (几何平均概率)，范围 0~1"""
+    if not token_logprobs:
+        return 0.0
+    return math.exp(sum(token_logprobs) / len(token_logprobs))
+
+
+def answer_tokens(tokenizer, token_ids, token_logprobs):
+    """截到第一个结束符 (含) 为止，去掉 <think> 块，返回最终答案的 (token ids, 对数概率)"""
+    if tokenizer.eos_token_id in token_ids:
+        end = token_ids.index(tokenizer.eos_token_id) + 1
+        token_ids, token_logprobs = token_ids[:end], token_logprobs[:end]
+    think_end_id = tokenizer.convert_tokens_to_ids('</think>')
+    if think_end_id in token_ids:
+        start = token_ids.index(think_end_id) + 1
+        token_ids, token_logprobs = token_ids[start:], token_logprobs[start:]
+        # </think> 后面紧跟的空行不算答案内容
+        while token_ids and not tokenizer.decode([token_ids[0]]).strip():
+            token_ids, token_logprobs = token_ids[1:], token_logprobs[1:]
+    return token_ids, token_logprobs
+
+
+def span_confidence(tokenizer, token_ids, token_logprobs, score_after):
+    """
+    只统计答案中匹配 score_after (正则) 之后的 token，
+    例如分类输出 '语义解析:xxx; 标准分类:xxx' 只对标准分类部分打分；找不到标记时退回整体
+    """
+    for k in range(len(token_ids)):
+        if re.search(score_after, tokenizer.decode(token_ids[:k + 1], skip_special_tokens=True)):
+            if token_logprobs[k + 1:]:
+                return sequence_confidence(token_logprobs[k + 1:])
+            break
+    return sequence_confidence(token_logprobs)
+
+
+def spans_confidence(tokenizer, token_ids, token_logprobs, spans):
+    """
+    对答案文本 (token_ids 解码结果) 中的多个字符区间 [start, end) 分别打分，
+    每个区间只统计与其重叠的 token，例如整表输出里每个字段的标准分类值
+    """
+    ends = [len(tokenizer.decode(token_ids[:k + 1], skip_special_tokens=True)) for k in range(len(token_ids))]
+    results = []
+    for start, end in spans:
+        lps = [lp for k, lp in enumerate(token_logprobs)
+               if ends[k] > start and (ends[k - 1] if k else 0) < end]
+        results.append(sequence_confidence(lps))
+    return results
+
+
+def build_chat_text(tokenizer, system_prompt, query):
+    # --- 构造 Qwen3 格式的 Prompt ---
+    # 手动拼接 ChatML 格式，确保与 Swift 内部模板一致
+    # <|im_start|>system\n...<|im_end|>\n<|im_start|>user\n...<|im_end|>\n<|im_start|>assistant\n
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query}
+    ]
+    return tokenizer.apply_chat_template(
+        messages,
+        tokenize=False,
+        add_generation_prompt=True
+    )
+
+
+def generation_kwargs(tokenizer, max_new_tokens, do_sample):
+    gen_kwargs = dict(
+        max_new_tokens=max_new_tokens,
+        pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        return_dict_in_generate=True,
+        output_logits=True, # 未经 temperature/top_p 处理的原始 logits
+    )
+    if do_sample:
+        gen_kwargs.update(temperature=0.1, top_p=0.9) # 低温，保证确定性
+    else:
+        gen_kwargs.update(do_sample=False) # 贪心解码，用于 CPU/GPU 结果对比
+    return gen_kwargs
+
+
+def generate_answer(model, tokenizer, system_prompt, query, max_new_tokens=128, do_sample=True):
+    """
+    单条推理，返回 (回复文本, 最终答案的 token ids, 对应的对数概率)
+    对数概率直接取自生成时的原始 logits，不需要额外前向计算；
+    Qwen3 的 <think>...</think> 部分不算答案，不计入 token 列表。
+    """
+    text = build_chat_text(tokenizer, system_prompt, query)
+
+    # 编码
+    model_inputs = tokenizer([text], return_tensors="pt").to(model.device)
+
+    # 生成
+    gen_kwargs = generation_kwargs(tokenizer, max_new_tokens, do_sample)
+    with torch.inference_mode():
+        outputs = model.generate(model_inputs.input_ids, **gen_kwargs)
+
+    # 解码 (只取生成的回复部分)
+    output_ids = outputs.sequences[0][model_inputs.input_ids.shape[1]:]
+    response = tokenizer.decode(output_ids, skip_special_tokens=True)
+
+    # 每步 logits -> 所选 token 的对数概率
+    logits = torch.stack(outputs.logits, dim=1)[0].float()
+    logprobs = torch.log_softmax(logits, dim=-1).gather(1, output_ids[:len(logits)].unsqueeze(1)).squeeze(1)
+    token_ids, token_logprobs = answer_tokens(tokenizer, output_ids.tolist(), logprobs.tolist())
+    return response, token_ids, token_logprobs
+
+
+def generate_with_confidence(model, tokenizer, system_prompt, query, max_new_tokens=128, do_sample=True,
+                             score_after=None):
+    """
+    单条推理，同时返回 (回复文本, 每个 token 的对数概率, 序列置信度)
+    传入 score_after 时置信度只统计该标记之后的 token (对数概率列表仍是完整答案的)
+    """
+    response, token_ids, token_logprobs = generate_answer(model, tokenizer, system_prompt, query,
+                                                          max_new_tokens=max_new_tokens, do_sample=do_sample)
+    if score_after:
+        return response, token_logprobs, span_confidence(tokenizer, token_ids, token_logprobs, score_after)
+    return response, token_logprobs, sequence_confidence(token_logprobs)
+
+
+def generate_batch_with_confidence(model, tokenizer, system_prompt, queries, max_new_tokens=128, do_sample=True,
+                                   score_after=None):
+    """批量推理 (左侧 padding)，返回 [(回复文本, 序列置信度)]，与输入顺序一致；score_after 同单条版本"""
+    texts = [build_chat_text(tokenizer, system_prompt, q) for q in queries]
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = 'left' # 解码器模型批量生成必须左侧补齐
+    model_inputs = tokenizer(texts, return_tensors="pt", padding=True).to(model.device)
+    tokenizer.padding_side = padding_side
+
+    gen_kwargs = generation_kwargs(tokenizer, max_new_tokens, do_sample)
+    with torch.inference_mode():
+        outputs = model.generate(
+            model_inputs.input_ids,
+            attention_mask=model_inputs.attention_mask,
+            **gen_kwargs
+        )
+
+    prompt_len = model_inputs.input_ids.shape[1]
+    output_ids = outputs.sequences[:, prompt_len:]
+    logits = torch.stack(outputs.logits, dim=1).float()
+    logprobs = torch.log_softmax(logits, dim=-1).gather(2, output_ids[:, :logits.shape[1]].unsqueeze(2)).squeeze(2)
+
+    results = []
+    for ids, lps in zip(output_ids.tolist(), logprobs.tolist()):
+        response = tokenizer.decode(ids, skip_special_tokens=True)
+        ids, lps = answer_tokens(tokenizer, ids, lps)
+        if score_after:
+            results.append((response, span_confidence(tokenizer, ids, lps, score_after)))
+        else:
+            results.append((response, sequence_confidence(lps)))
+    return results
+
+
+def generate_response(model, tokenizer, system_prompt, query, max_new_tokens=128, do_sample=True):
+    """单条推理，返回模型回复文本"""
+    response, _, _ = generate_with_confidence(model, tokenizer, system_prompt, query,
+                                              max_new_tokens=max_new_tokens, do_sample=do_sample)
+    return response
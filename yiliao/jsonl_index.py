@@ -0,0 +1,224 @@
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+
+# ================= 配置区 =================
+# JSONL 随机访问：第一次扫描时记下每条记录的字节偏移，保存为 <文件名>.idx，
+# 之后通过内存映射按偏移直接取第 i 条，切分片、抽样、断点续跑都不需要从头解析。
+# 与各脚本的读取逻辑一致，空行不计入记录。
+
+INDEX_SUFFIX = '.idx'
+_MAGIC = b'JSONLIDX'
+_VERSION = 2
+# 文件头: magic, 版本, 源文件大小, 源文件 mtime_ns, 记录数, 已索引内容的 crc32
+_HEADER = struct.Struct('<8sIQqQI')
+_CRC_CHUNK = 16 * 1024 * 1024
+
+
+def _crc32(mm, start, end, crc=0):
+    """分块计算 [start, end) 的 crc32，可接着上一段的 crc 继续算"""
+    for pos in range(start, end, _CRC_CHUNK):
+        crc = zlib.crc32(mm[pos:min(pos + _CRC_CHUNK, end)], crc)
+    return crc
+
+
+def _scan_offsets(mm, start, end, offsets):
+    """扫描 [start, end) 区间，按 (起始, 结束) 成对追加每条非空记录的字节偏移"""
+    pos = start
+    while pos < end:
+        nl = mm.find(b'\n', pos, end)
+        line_end = end if nl == -1 else nl
+        if mm[pos:line_end].strip():
+            offsets.append(pos)
+            offsets.append(line_end)
+        pos = line_end + 1
+
+
+class JsonlIndex:
+    """
+    用法:
+        idx = JsonlIndex('step2_predicted_desc.jsonl')
+        len(idx); idx[10]; idx[-1]
+        for record in idx.iter_range(*idx.shard_range(0, 4)): ...
+        idx.sample(100, seed=42)
+    """
+
+    def __init__(self, file_path, index_path=None):
+        self.file_path = file_path
+        self.index_path = index_path or file_path + INDEX_SUFFIX
+        self._file = open(file_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.offsets = self._load_or_build(size)
+
+    # ---------- 索引构建 / 加载 ----------
+
+    def _load_or_build(self, size):
+        stat = os.stat(self.file_path)
+        offsets = array('Q')
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'rb') as f:
+                    header = f.read(_HEADER.size)
+                    if len(header) == _HEADER.size:
+                        magic, version, old_size, old_mtime, count, old_crc = _HEADER.unpack(header)
+                        if magic == _MAGIC and version == _VERSION:
+                            offsets.fromfile(f, count * 2)
+                            if old_size == size and old_mtime == stat.st_mtime_ns:
+                                return offsets
+                            # 只在末尾追加了内容 (如推理结果边跑边写)：旧内容校验一致时从旧的结尾继续扫描
+                            if (old_size < size
+                                    and (old_size == 0 or self._mm[old_size - 1:old_size] == b'\n')
+                                    and _crc32(self._mm, 0, old_size) == old_crc):
+                                _scan_offsets(self._mm, old_size, size, offsets)
+                                self._save(offsets, size, stat.st_mtime_ns,
+                                           _crc32(self._mm, old_size, size, old_crc))
+                                return offsets
+            except (OSError, ValueError, EOFError) as e:
+                # 索引文件被截断或损坏：丢弃重建
+                print(f"警告: 索引文件 {self.index_path} 已损坏，重新建立: {e}")
+            offsets = array('Q')
+
+        crc = 0
+        if self._mm is not None:
+            _scan_offsets(self._mm, 0, size, offsets)
+            crc = _crc32(self._mm, 0, size)
+        self._save(offsets, size, stat.st_mtime_ns, crc)
+        return offsets
+
+    def _save(self, offsets, size, mtime_ns, crc):
+        # 临时文件名按进程唯一，多个分片进程同时建索引时互不覆盖
+        index_dir, index_name = os.path.split(self.index_path)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=index_dir or '.', prefix=index_name + '.', suffix='.tmp')
+        except OSError as e:
+            # 只读目录等情况下不落盘，本次仍可使用内存中的索引
+            print(f"警告: 无法保存索引文件 {self.index_path}: {e}")
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, size, mtime_ns, len(offsets) // 2, crc))
+                offsets.tofile(f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"警告: 无法保存索引文件 {self.index_path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    # ---------- 随机访问 ----------
+
+    def __len__(self):
+        return len(self.offsets) // 2
+
+    def raw(self, i):
+        """第 i 条记录的原始字节 (不含换行)"""
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(f"记录下标越界: {i} (共 {n} 条)")
+        return self._mm[self.offsets[2 * i]:self.offsets[2 * i + 1]]
+
+    def __getitem__(self, i):
+        return json.loads(self.raw(i))
+
+    def __iter__(self):
+        return self.iter_range(0, len(self))
+
+    def iter_range(self, start, end):
+        """按顺序读取 [start, end) 的记录，坏行返回 None 以保持下标对齐"""
+        for i in range(start, min(end, len(self))):
+            try:
+                yield self[i]
+            except ValueError:
+                yield None
+
+    def shard_range(self, shard_id, num_shards):
+        """把记录均分成 num_shards 个连续区间，返回第 shard_id 个的 (start, end)"""
+        if not 0 <= shard_id < num_shards:
+            raise ValueError(f"分片序号应在 0~{num_shards - 1} 之间: {shard_id}")
+        n = len(self)
+        return n * shard_id // num_shards, n * (shard_id + 1) // num_shards
+
+    def sample_indices(self, k, seed=None):
+        """均匀随机抽取 k 个下标 (不放回)"""
+        rng = random.Random(seed)
+        return rng.sample(range(len(self)), min(k, len(self)))
+
+    def sample(self, k, seed=None):
+        """均匀随机抽取 k 条，只读取被抽中的记录"""
+        return [self[i] for i in self.sample_indices(k, seed)]
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def split_file(file_path, num_shards):
+    """按记录数均分成多个文件，直接拷贝原始字节，不解析 JSON"""
+    file_dir, file_name = os.path.split(file_path)
+    base_name = os.path.splitext(file_name)[0]
+    outputs = []
+    with JsonlIndex(file_path) as idx:
+        for shard_id in range(num_shards):
+            start, end = idx.shard_range(shard_id, num_shards)
+            out_path = os.path.join(file_dir, f"{base_name}.part{shard_id}.jsonl")
+            with open(out_path, 'wb') as f:
+                for i in range(start, end):
+                    f.write(idx.raw(i) + b'\n')
+            outputs.append((out_path, end - start))
+    return outputs
+
+
+def sample_file(file_path, k, seed=None):
+    file_dir, file_name = os.path.split(file_path)
+    base_name = os.path.splitext(file_name)[0]
+    out_path = os.path.join(file_dir, f"{base_name}.sample{k}.jsonl")
+    with JsonlIndex(file_path) as idx:
+        picks = idx.sample_indices(k, seed)
+        with open(out_path, 'wb') as f:
+            for i in picks:
+                f.write(idx.raw(i) + b'\n')
+    return out_path, len(picks)
+
+
+if __name__ == "__main__":
+    usage = (
+        "使用方法:\n"
+        "  python jsonl_index.py build  <jsonl文件>            # 建立/更新索引并输出记录数\n"
+        "  python jsonl_index.py get    <jsonl文件> <下标>      # 读取第 i 条\n"
+        "  python jsonl_index.py split  <jsonl文件> <分片数>    # 均分成多个文件\n"
+        "  python jsonl_index.py sample <jsonl文件> <条数> [随机种子]"
+    )
+    if len(sys.argv) < 3 or not os.path.exists(sys.argv[2]):
+        print(usage)
+    elif sys.argv[1] == 'build':
+        with JsonlIndex(sys.argv[2]) as idx:
+            print(f"记录数: {len(idx)}，索引文件: {idx.index_path}")
+    elif sys.argv[1] == 'get' and len(sys.argv) > 3:
+        with JsonlIndex(sys.argv[2]) as idx:
+            print(json.dumps(idx[int(sys.argv[3])], ensure_ascii=False, indent=2))
+    elif sys.argv[1] == 'split' and len(sys.argv) > 3:
+        for path, count in split_file(sys.argv[2], int(sys.argv[3])):
+            print(f"{path}: {count} 条")
+    elif sys.argv[1] == 'sample' and len(sys.argv) > 3:
+        seed = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        path, count = sample_file(sys.argv[2], int(sys.argv[3]), seed)
+        print(f"{path}: {count} 条")
+    else:
+        print(usage)
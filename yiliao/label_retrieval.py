@@ -0,0 +1,183 @@
+import csv
+import math
+import os
+import re
+import sys
+from collections import Counter
+from prepare_step3_final import detect_encoding
+
+# ================= 配置区 =================
+# 候选标签检索：不再把整棵标签树塞进每条 prompt，
+# 而是按字段的 name / nickname / uri 检索最相关的 top-k 棵子树，只把这些子树放进 prompt。
+
+# 子树根节点所在层级 (按 '-' 切分后的段数)，
+# 健康医疗数据规范第 3 层如 '健康医疗数据规范-个人属性数据-个人身份信息'
+SUBTREE_DEPTH = 3
+
+# 打分权重：字符 n-gram TF-IDF 余弦 + 词面命中
+NGRAM_WEIGHT = 0.7
+LEXICAL_WEIGHT = 0.3
+NGRAM_SIZES = (1, 2)
+
+# 评估 recall@k 时的 k 值
+EVAL_KS = [1, 3, 5, 10, 20]
+
+
+def char_ngrams(text):
+    grams = Counter()
+    for n in NGRAM_SIZES:
+        for i in range(len(text) - n + 1):
+            grams[text[i:i + n]] += 1
+    return grams
+
+
+def field_text(row):
+    """字段检索用文本：注释 (或补全的注释) 为主，表名/字段名拆词后附上"""
+    parts = [row.get('nickname', ''), row.get('predicted_desc', '')]
+    for key in ('name', 'uri'):
+        value = row.get(key, '') or ''
+        parts.append(' '.join(t for t in re.split(r'[_\W\d]+', value.lower()) if t))
+    return ' '.join(p.strip() for p in parts if p and p.strip())
+
+
+def split_labels(value):
+    return [v.strip() for v in (value or '').split(';') if v.strip()]
+
+
+class LabelRetriever:
+    def __init__(self, standard_file, depth=SUBTREE_DEPTH):
+        with open(standard_file, 'r', encoding='utf-8') as f:
+            lines = [line.strip() for line in f if line.strip()]
+        self.all_lines = lines
+
+        # 1. 按层级切出子树：根节点 -> 子树内所有路径
+        self.subtrees = {}
+        for line in lines:
+            parts = line.split('-')
+            if len(parts) < depth:
+                continue
+            root = '-'.join(parts[:depth])
+            self.subtrees.setdefault(root, []).append(line)
+        self.roots = list(self.subtrees)
+
+        # 2. 每棵子树的节点名 (去掉公共前缀)，用于词面命中和 n-gram 向量
+        self.node_names = {}
+        for root, paths in self.subtrees.items():
+            names = set()
+            for path in paths:
+                names.update(path.split('-')[depth - 1:])
+            self.node_names[root] = names
+
+        # 3. 子树 TF-IDF 向量
+        doc_grams = {root: char_ngrams(' '.join(sorted(names))) for root, names in self.node_names.items()}
+        df = Counter()
+        for grams in doc_grams.values():
+            df.update(grams.keys())
+        n_docs = len(doc_grams)
+        self.idf = {g: math.log((n_docs + 1) / (c + 1)) + 1 for g, c in df.items()}
+        self.doc_vectors = {root: self._normalize(self._tfidf(grams)) for root, grams in doc_grams.items()}
+
+    def _tfidf(self, grams):
+        return {g: c * self.idf[g] for g, c in grams.items() if g in self.idf}
+
+    @staticmethod
+    def _normalize(vec):
+        norm = math.sqrt(sum(v * v for v in vec.values()))
+        return {g: v / norm for g, v in vec.items()} if norm else {}
+
+    def score(self, row):
+        """返回 [(子树根, 分数)]，按分数从高到低排列"""
+        text = field_text(row)
+        query_vec = self._normalize(self._tfidf(char_ngrams(text)))
+        scored = []
+        for root in self.roots:
+            doc_vec = self.doc_vectors[root]
+            cosine = sum(v * doc_vec.get(g, 0.0) for g, v in query_vec.items())
+            # 词面命中：子树中有节点名完整出现在字段文本里，按命中长度占比计分
+            hit = max((len(name) for name in self.node_names[root] if len(name) >= 2 and name in text), default=0)
+            lexical = min(1.0, hit / max(len(text), 1) * 4)
+            scored.append((root, NGRAM_WEIGHT * cosine + LEXICAL_WEIGHT * lexical))
+        scored.sort(key=lambda x: -x[1])
+        return scored
+
+    def top_k(self, row, k):
+        return [root for root, _ in self.score(row)[:k]]
+
+    def render(self, roots):
+        """把选中的子树还原成标签清单文本 (含祖先节点，保证路径完整)"""
+        keep = set()
+        for root in roots:
+            parts = root.split('-')
+            for i in range(1, len(parts)):
+                keep.add('-'.join(parts[:i]))
+            keep.update(self.subtrees[root])
+        return '\n'.join(line for line in self.all_lines if line in keep)
+
+    def candidate_block(self, row, k):
+        return self.render(self.top_k(row, k))
+
+
+def label_hit(label, roots):
+    """标签落在任一候选子树内 (或是候选子树的祖先) 即视为命中"""
+    for root in roots:
+        if label == root or label.startswith(root + '-') or root.startswith(label + '-'):
+            return True
+    return False
+
+
+def evaluate_recall(standard_file, csv_files, ks=EVAL_KS):
+    if not os.path.exists(standard_file):
+        print(f"错误: 找不到标准文件 {standard_file}")
+        return
+
+    retriever = LabelRetriever(standard_file)
+    print(f"标签树: {len(retriever.all_lines)} 个节点，切分为 {len(retriever.roots)} 棵子树 (第 {SUBTREE_DEPTH} 层)")
+
+    max_k = max(ks)
+    hits = Counter()
+    prompt_chars = Counter()
+    total = 0
+
+    for csv_file in csv_files:
+        if not os.path.exists(csv_file):
+            print(f"警告: 找不到文件 {csv_file}，跳过")
+            continue
+        encoding = detect_encoding(csv_file)
+        with open(csv_file, 'r', encoding=encoding, newline='') as f:
+            for row in csv.DictReader(f, delimiter=','):
+                labels = split_labels(row.get('personalSign')) + split_labels(row.get('businessSign'))
+                if not labels:
+                    continue
+                total += 1
+                ranked = retriever.top_k(row, max_k)
+                for k in ks:
+                    roots = ranked[:k]
+                    # 多标签字段：全部标签都被召回才算命中
+                    if all(label_hit(label, roots) for label in labels):
+                        hits[k] += 1
+                    if total <= 200:
+                        prompt_chars[k] += len(retriever.render(roots))
+
+    if total == 0:
+        print("错误: 没有带标签的数据可用于评估")
+        return
+
+    full_chars = len('\n'.join(retriever.all_lines))
+    sampled = min(total, 200)
+    print("=" * 50)
+    print(f"评估字段数: {total}")
+    print(f"完整标签树 prompt 长度: {full_chars} 字符")
+    for k in ks:
+        avg_chars = prompt_chars[k] / sampled
+        print(f"recall@{k:<3}: {hits[k] / total:.1%}   平均候选标签长度 {avg_chars:.0f} 字符 "
+              f"({avg_chars / full_chars:.0%} of 全量)")
+    print("=" * 50)
+    return {k: hits[k] / total for k in ks}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("使用方法: python label_retrieval.py <标准文件> <带标签的CSV> [更多CSV ...]")
+        print("示例: python label_retrieval.py standard.txt dataAssetsDownloadCsv1767599371quanbu.csv")
+    else:
+        evaluate_recall(sys.argv[1], sys.argv[2:])
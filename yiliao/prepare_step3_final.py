@@ -3,6 +3,7 @@ import json
 import sys
 import os
 import random
+import re
 
 # ================= 配置区 =================
 
@@ -29,6 +30,15 @@ def detect_encoding(file_path):
             continue
     return 'utf-8' # 保底
 
+def site_name(csv_file):
+    """
+    导出文件名 -> 站点名，用于评估时按站点分组
+    dataAssetsDownloadCsv1767599528binhaiziyeHIS.csv -> binhaiziyeHIS
+    """
+    name = os.path.splitext(os.path.basename(csv_file))[0]
+    name = re.sub(r'^dataAssetsDownloadCsv\d+', '', name)
+    return name.strip('.') or os.path.basename(csv_file)
+
 def load_predicted_descs(file_path):
     """
     加载 Step 2 生成的补全文件，建立映射字典
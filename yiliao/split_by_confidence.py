@@ -0,0 +1,110 @@
+import json
+import os
+import sys
+
+# ================= 配置区 =================
+# 按置信度把推理结果分成「自动采纳」和「人工复核」两个文件，
+# 人工复核和二次推理只针对低置信度的那部分。
+
+DEFAULT_THRESHOLD = 0.9
+
+# 依次尝试的置信度字段 (Step2 补全 / Step4 分类)
+# compare_checkpoints.py 的输出每个 checkpoint 一列 '<字段>@<checkpoint名>'：
+# 指定 checkpoint 名时只看该列，否则取各列最小值 (所有 checkpoint 都有把握才自动采纳)
+CONFIDENCE_FIELDS = ['predicted_desc_confidence', '标准分类_置信度']
+
+# 置信度分布统计的分段
+BUCKETS = [0.5, 0.7, 0.8, 0.9, 0.95, 1.01]
+
+
+def get_confidence(record, checkpoint=None):
+    for field in CONFIDENCE_FIELDS:
+        if checkpoint is None and field in record:
+            return record[field]
+        if checkpoint is not None:
+            if f"{field}@{checkpoint}" in record:
+                return record[f"{field}@{checkpoint}"]
+            continue
+        values = [v for k, v in record.items() if k.startswith(field + '@')]
+        if values:
+            return min(values)
+    return None
+
+
+def split_by_confidence(input_file, threshold=DEFAULT_THRESHOLD, checkpoint=None):
+    if not os.path.exists(input_file):
+        print(f"错误: 找不到文件 {input_file}")
+        return
+
+    file_dir, file_name = os.path.split(input_file)
+    base_name = os.path.splitext(file_name)[0]
+    accept_file = os.path.join(file_dir, f"{base_name}_accept.jsonl")
+    review_file = os.path.join(file_dir, f"{base_name}_review.jsonl")
+
+    accept_count = 0
+    review_count = 0
+    missing_count = 0
+    bucket_counts = [0] * len(BUCKETS)
+
+    with open(input_file, 'r', encoding='utf-8') as f, \
+            open(accept_file, 'w', encoding='utf-8') as f_accept, \
+            open(review_file, 'w', encoding='utf-8') as f_review:
+        for line in f:
+            if not line.strip(): continue
+            try:
+                record = json.loads(line)
+            except:
+                continue
+
+            confidence = get_confidence(record, checkpoint)
+            out_line = json.dumps(record, ensure_ascii=False) + '\n'
+            if confidence is None:
+                # 没有置信度的 (旧版本结果) 一律进复核
+                missing_count += 1
+                review_count += 1
+                f_review.write(out_line)
+                continue
+
+            for idx, upper in enumerate(BUCKETS):
+                if confidence < upper:
+                    bucket_counts[idx] += 1
+                    break
+
+            if confidence >= threshold:
+                accept_count += 1
+                f_accept.write(out_line)
+            else:
+                review_count += 1
+                f_review.write(out_line)
+
+    total = accept_count + review_count
+    if total == 0:
+        print("错误: 文件中没有有效记录。")
+        return
+
+    print("=" * 50)
+    print(f"置信度阈值: {threshold}")
+    if checkpoint is not None:
+        print(f"按 checkpoint: {checkpoint}")
+    print("置信度分布:")
+    lower = 0.0
+    for upper, count in zip(BUCKETS, bucket_counts):
+        print(f"    [{lower:.2f}, {min(upper, 1.0):.2f}{']' if upper > 1 else ')'}: {count} 条")
+        lower = upper
+    if missing_count:
+        print(f"    缺少置信度字段: {missing_count} 条")
+    print(f"[1] 自动采纳: {accept_count} 条 ({accept_count / total:.1%})")
+    print(f"    保存位置: {accept_file}")
+    print(f"[2] 人工复核: {review_count} 条 ({review_count / total:.1%})")
+    print(f"    保存位置: {review_file}")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("使用方法: python split_by_confidence.py <推理结果jsonl> [置信度阈值] [checkpoint名]")
+        print("示例: python split_by_confidence.py step2_predicted_desc.jsonl 0.9")
+        print("      python split_by_confidence.py compare_checkpoints.jsonl 0.9 checkpoint-16560")
+    else:
+        threshold = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_THRESHOLD
+        split_by_confidence(sys.argv[1], threshold, sys.argv[3] if len(sys.argv) > 3 else None)
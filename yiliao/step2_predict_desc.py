@@ -1,13 +1,14 @@
 import os
+import sys
 import json
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from swift import Swift
+from jsonl_index import JsonlIndex
+from infer_common import load_model, generate_with_confidence
 
 # ================= 配置区 =================
-os.environ['CUDA_VISIBLE_DEVICES'] = '0'
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '0')  # 已在环境变量中指定时不覆盖 (多卡分片各用一张卡)
 
 # 1. Checkpoint 路径 (请确认路径正确)
+#    也可以指向 export_merged_model.py 导出的合并模型目录，省去挂载 LoRA (提速效果用其 bench 子命令测量)
 ckpt_dir = '/home/gao/my_swift_project/output/fenleifenji_step1/checkpoint-16560'
 
 # 2. 输入/输出文件
@@ -22,62 +23,73 @@ SYSTEM_PROMPT = (
     "直接输出中文含义即可，无需解释。"
 )
 
-def get_base_model_path(ckpt_dir):
-
-    return '/root/.cache/modelscope/hub/models/Qwen/Qwen3-8B'
-
-    """从 args.json 中读取底座模型路径"""
-    args_path = os.path.join(ckpt_dir, 'sft_args.json')
-    if not os.path.exists(args_path):
-        # 兼容旧版文件名为 args.json
-        args_path = os.path.join(ckpt_dir, 'args.json')
-    
-    if os.path.exists(args_path):
-        with open(args_path, 'r') as f:
-            args = json.load(f)
-            # 优先尝试读取 model_id_or_path，如果没有则尝试 model
-            return args.get('model_id_or_path', args.get('model', 'Qwen/Qwen3-8B'))
-    return 'Qwen/Qwen3-8B' # 保底默认值
-
-def predict():
-    # 1. 自动获取底座模型名称
-    base_model_path = get_base_model_path(ckpt_dir)
-    print(f"检测到底座模型: {base_model_path}")
-    print(f"正在加载 LoRA 权重: {ckpt_dir}")
-
-    # 2. 加载分词器
-    tokenizer = AutoTokenizer.from_pretrained(
-        base_model_path, 
-        trust_remote_code=True
-    )
-
-    # 3. 加载模型 (原生 Transformers)
-    model = AutoModelForCausalLM.from_pretrained(
-        base_model_path,
-        device_map="auto",
-        torch_dtype=torch.float16, # 显存不够可改为 bfloat16 或 load_in_8bit=True
-        trust_remote_code=True
+# 4. 推理设备: 'cuda' 或 'cpu'
+# CPU 模式会把 LoRA 合并进底座权重并对线性层做 int8 动态量化，适合没有 GPU 的现场服务器
+DEVICE = 'cuda'
+CPU_THREADS = 16    # CPU 推理线程数，建议设为物理核数
+CPU_QUANTIZE = True # 关闭则以 fp32 推理 (更准但更慢、更占内存)
+
+def shard_output_file(shard_id, num_shards):
+    """多分片并行时每个分片写自己的输出文件"""
+    if num_shards == 1:
+        return output_file
+    base, ext = os.path.splitext(output_file)
+    return f"{base}.part{shard_id}{ext}"
+
+
+def resume_position(out_path, start):
+    """
+    断点续跑：返回 (继续的下标, 需保留的字节数)
+    从已有输出的最后一条完整记录的 source_index 之后继续；之后的字节是崩溃时写了一半的行，需截掉
+    """
+    if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
+        return start, 0
+    with JsonlIndex(out_path) as done:
+        for i in range(len(done) - 1, -1, -1):
+            try:
+                return max(start, done[i]['source_index'] + 1), done.offsets[2 * i + 1]
+            except ValueError:
+                continue
+            except KeyError:
+                print(f"警告: {out_path} 中的记录没有 source_index，无法续跑，将从头覆盖")
+                break
+    return start, 0
+
+
+def predict(shard_id=0, num_shards=1, resume=False):
+    # 1. 加载分词器 + 模型 + Swift LoRA 权重
+    model, tokenizer = load_model(
+        ckpt_dir,
+        device=DEVICE,
+        cpu_threads=CPU_THREADS,
+        quantize=CPU_QUANTIZE
     )
-
-    # 4. 加载 Swift LoRA 权重
-    model = Swift.from_pretrained(model, ckpt_dir, inference_mode=True)
     
     print("模型加载成功！开始推理...")
 
-    # 读取输入
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-
-    f_out = open(output_file, 'w', encoding='utf-8')
+    # 读取输入 (字节偏移索引 + 内存映射，按需读取本分片的记录)
+    records = JsonlIndex(input_file)
+    start, end = records.shard_range(shard_id, num_shards)
+    out_path = shard_output_file(shard_id, num_shards)
+    # 默认覆盖输出 (换了 ckpt_dir 重跑即得到新结果)；--resume 时才接着已有输出继续
+    resume_from, keep_bytes = resume_position(out_path, start) if resume else (start, 0)
+    if resume_from > start:
+        print(f"检测到已有输出，从第 {resume_from} 条继续")
+        # 截掉最后一条完整记录之后的残行，并补上它的换行，再接着追加
+        with open(out_path, 'r+b') as f:
+            f.truncate(keep_bytes)
+        f_out = open(out_path, 'a', encoding='utf-8')
+        f_out.write('\n')
+    else:
+        f_out = open(out_path, 'w', encoding='utf-8')
     
     # 进度条
-    total = len(lines)
+    total = len(records)
+    print(f"分片 {shard_id + 1}/{num_shards}: 第 {start} ~ {end - 1} 条 (共 {total} 条)")
     
-    for i, line in enumerate(lines):
-        if not line.strip(): continue
-        
+    for i in range(resume_from, end):
         try:
-            entry = json.loads(line)
+            entry = records[i]
             # 兼容 query / raw_data
             if 'query' in entry:
                 query = entry['query']
@@ -88,55 +100,40 @@ def predict():
             else:
                 continue
             
-            # --- 构造 Qwen3 格式的 Prompt ---
-            # 手动拼接 ChatML 格式，确保与 Swift 内部模板一致
-            # <|im_start|>system\n...<|im_end|>\n<|im_start|>user\n...<|im_end|>\n<|im_start|>assistant\n
-            messages = [
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": query}
-            ]
-            text = tokenizer.apply_chat_template(
-                messages, 
-                tokenize=False, 
-                add_generation_prompt=True
+            response, token_logprobs, confidence = generate_with_confidence(
+                model, tokenizer, SYSTEM_PROMPT, query
             )
             
-            # 编码
-            model_inputs = tokenizer([text], return_tensors="pt").to(model.device)
-            
-            # 生成
-            generated_ids = model.generate(
-                model_inputs.input_ids,
-                max_new_tokens=128,
-                pad_token_id=tokenizer.pad_token_id,
-                eos_token_id=tokenizer.eos_token_id,
-                temperature=0.1, # 低温，保证确定性
-                top_p=0.9
-            )
-            
-            # 解码 (只取生成的回复部分)
-            generated_ids = [
-                output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-            ]
-            response = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-            
             # 保存
             new_record = entry.copy()
             new_record['predicted_desc'] = response.strip()
+            # 置信度 (答案 token 几何平均概率)，用 split_by_confidence.py 分流人工复核
+            new_record['predicted_desc_confidence'] = round(confidence, 4)
+            new_record['predicted_desc_logprobs'] = [round(lp, 4) for lp in token_logprobs]
             new_record['query'] = query # 补全 query 方便后续使用
+            new_record['source_index'] = i # 输入文件中的记录下标，用于断点续跑
             
             f_out.write(json.dumps(new_record, ensure_ascii=False) + '\n')
             f_out.flush()
             
             if (i+1) % 10 == 0:
-                print(f"[{i+1}/{total}] {response}")
+                print(f"[{i+1}/{total}] ({confidence:.2f}) {response}")
 
         except Exception as e:
             print(f"Error line {i}: {e}")
             continue
 
     f_out.close()
-    print(f"完成！结果已保存在 {output_file}")
+    records.close()
+    print(f"完成！结果已保存在 {out_path}")
 
 if __name__ == "__main__":
-    predict()
+    # 多卡/多机并行: python step2_predict_desc.py <分片序号> <分片总数>
+    #   每个分片用环境变量指定自己的卡，如 CUDA_VISIBLE_DEVICES=1 python step2_predict_desc.py 1 4
+    # 中断后续跑 (须使用同一个 ckpt_dir): python step2_predict_desc.py [<分片序号> <分片总数>] --resume
+    resume = '--resume' in sys.argv
+    args = [a for a in sys.argv[1:] if a != '--resume']
+    if len(args) >= 2:
+        predict(int(args[0]), int(args[1]), resume=resume)
+    else:
+        predict(resume=resume)
@@ -0,0 +1,132 @@
+import os
+import sys
+import csv
+import json
+import re
+from infer_common import load_model, generate_with_confidence, sequence_confidence
+from prepare_step3_final import FINAL_SYSTEM_PROMPT, detect_encoding, load_predicted_descs, site_name, clean_desc
+from label_retrieval import LabelRetriever
+
+# ================= 配置区 =================
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '0')  # 已在环境变量中指定时不覆盖
+
+# 1. Step 3 分类模型的 Checkpoint 路径 (请确认路径正确)
+#    也可以指向 export_merged_model.py 导出的合并模型目录，省去挂载 LoRA (提速效果用其 bench 子命令测量)
+ckpt_dir = '/home/gao/my_swift_project/output/fenleifenji_step3/checkpoint-last'
+
+# 2. 输出文件
+output_file = 'step4_classified.jsonl'
+
+# 3. 推理设备: 'cuda' 或 'cpu' (CPU 模式说明见 step2_predict_desc.py)
+DEVICE = 'cuda'
+CPU_THREADS = 16
+CPU_QUANTIZE = True
+
+# 4. 候选标签检索 (见 label_retrieval.py)
+# 大于 0 时按字段检索 top-k 棵标签子树，作为 <可用标签标准> 附在 system prompt 后；
+# 0 表示关闭，与 Step 3 训练时的 prompt 保持一致。k 的取值参考 label_retrieval.py 输出的 recall@k
+CANDIDATE_TOPK = 0
+STANDARD_FILE = 'standard.txt'
+
+# 标准分类置信度只统计该标记之后的 token，不受前面语义解析自由文本的影响
+LABEL_MARKER = r'标准分类[:：]'
+
+
+def parse_classify_response(text):
+    """
+    解析模型输出 '语义解析:xxx; 标准分类:xxx' 或 '标准分类:xxx'
+    返回 (语义解析, 标准分类)，解析不到的部分为空字符串
+    """
+    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
+    desc_match = re.search(r'语义解析[:：]\s*(.*?)\s*(?:[;；]\s*标准分类|$)', text, flags=re.DOTALL)
+    label_match = re.search(r'标准分类[:：]\s*(.+)$', text, flags=re.DOTALL)
+    desc = desc_match.group(1).strip() if desc_match else ''
+    label = label_match.group(1).strip() if label_match else ''
+    return desc, label
+
+
+def build_classify_query(row, predicted_map):
+    """按 Step 3 训练时的双模态格式构造 query：有 Desc 用判别模式，无 Desc 用推理模式"""
+    uri = row.get('uri', '').strip()
+    name = row.get('name', '').strip()
+    query_key = f"tablename:{uri}; colname:{name}"
+
+    desc = clean_desc(row.get('nickname', '').strip())
+    if not desc:
+        desc = predicted_map.get(query_key, '')
+
+    if desc:
+        return f"{query_key}; Desc:{desc}"
+    return query_key
+
+
+def build_system_prompt(row, predicted_map, retriever):
+    if retriever is None:
+        return FINAL_SYSTEM_PROMPT
+    query_key = f"tablename:{row.get('uri', '').strip()}; colname:{row.get('name', '').strip()}"
+    field = dict(row, predicted_desc=predicted_map.get(query_key, ''))
+    block = retriever.candidate_block(field, CANDIDATE_TOPK)
+    return f"{FINAL_SYSTEM_PROMPT}\n<可用标签标准>\n{block}\n</可用标签标准>"
+
+
+def classify(csv_file, step2_file=None):
+    if not os.path.exists(csv_file):
+        print(f"错误: 找不到文件 {csv_file}")
+        return
+
+    predicted_map = load_predicted_descs(step2_file) if step2_file else {}
+    retriever = LabelRetriever(STANDARD_FILE) if CANDIDATE_TOPK > 0 else None
+
+    model, tokenizer = load_model(
+        ckpt_dir,
+        device=DEVICE,
+        cpu_threads=CPU_THREADS,
+        quantize=CPU_QUANTIZE
+    )
+    print("模型加载成功！开始分类...")
+
+    site = site_name(csv_file)
+    csv_encoding = detect_encoding(csv_file)
+    with open(csv_file, 'r', encoding=csv_encoding, newline='') as f:
+        rows = list(csv.DictReader(f, delimiter=','))
+    total = len(rows)
+
+    with open(output_file, 'w', encoding='utf-8') as f_out:
+        for i, row in enumerate(rows):
+            try:
+                query = build_classify_query(row, predicted_map)
+                system_prompt = build_system_prompt(row, predicted_map, retriever)
+                response, token_logprobs, confidence = generate_with_confidence(
+                    model, tokenizer, system_prompt, query, score_after=LABEL_MARKER
+                )
+                desc, label = parse_classify_response(response)
+
+                record = {
+                    "query": query,
+                    "raw_data": row,
+                    "site": site,
+                    "response": response.strip(),
+                    "语义解析": desc,
+                    "标准分类": label,
+                    "标准分类_置信度": round(confidence, 4),
+                    "整体置信度": round(sequence_confidence(token_logprobs), 4),
+                    "token_logprobs": [round(lp, 4) for lp in token_logprobs]
+                }
+                f_out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f_out.flush()
+
+                if (i+1) % 10 == 0:
+                    print(f"[{i+1}/{total}] {query} -> {label} ({confidence:.2f})")
+
+            except Exception as e:
+                print(f"Error row {i}: {e}")
+                continue
+
+    print(f"完成！结果已保存在 {output_file}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("使用方法: python step4_predict_classify.py <原始CSV> [Step2补全文件]")
+    else:
+        classify(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
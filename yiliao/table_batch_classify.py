@@ -0,0 +1,219 @@
+import os
+import sys
+import csv
+import json
+import re
+from infer_common import load_model, generate_answer, generate_with_confidence, spans_confidence
+from prepare_step3_final import FINAL_SYSTEM_PROMPT, detect_encoding, load_predicted_descs, site_name
+from step4_predict_classify import build_classify_query, parse_classify_response, LABEL_MARKER
+
+# ================= 配置区 =================
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '0')  # 已在环境变量中指定时不覆盖
+
+# 1. Step 3 分类模型的 Checkpoint 路径 (也可以是合并模型目录)
+ckpt_dir = '/home/gao/my_swift_project/output/fenleifenji_step3/checkpoint-last'
+
+# 2. 输出文件
+output_file = 'step4_classified_table.jsonl'
+
+# 3. 推理设备 (说明见 step2_predict_desc.py)
+DEVICE = 'cuda'
+CPU_THREADS = 16
+CPU_QUANTIZE = True
+
+# 4. 整表打包参数
+# 同一 uri (表) 的字段打包进一条 prompt，按 token 预算切块；
+# 字段数太少的表打包收益不大，直接走单字段模式。
+# 注意：Step 3 训练数据是单字段格式，整表格式的效果建议先用 evaluate_predictions.py 对比确认
+TABLE_TOKEN_BUDGET = 1024    # 每块字段清单的 token 上限
+MAX_COLUMNS_PER_CALL = 30
+MIN_COLUMNS_PER_CALL = 2
+NEW_TOKENS_PER_COLUMN = 48   # 每个字段预留的输出 token 数
+
+TABLE_SYSTEM_PROMPT = (
+    FINAL_SYSTEM_PROMPT +
+    "\n本次输入为同一张表的多个字段，请逐个字段判断【标准分类】，"
+    "只输出 JSON 数组，每个元素形如 {\"id\": 序号, \"标准分类\": \"xxx\"}，不要输出其他内容。"
+)
+
+
+def column_line(idx, query):
+    """字段清单中的一行：去掉公共的 tablename 前缀"""
+    column = re.sub(r'^tablename:[^;]*;\s*', '', query)
+    return f"{idx}. {column}"
+
+
+def build_table_query(uri, queries):
+    lines = [column_line(i + 1, q) for i, q in enumerate(queries)]
+    return f"tablename:{uri}\n共 {len(queries)} 个字段:\n" + "\n".join(lines)
+
+
+def parse_table_response(text, n):
+    """
+    解析整表输出 (不含 <think> 的答案文本)，返回 {序号(从 1 开始): (标准分类, 起始字符偏移, 结束字符偏移)}
+    偏移用于只对该字段的标准分类 token 打分。
+    优先逐个解析 JSON 对象，失败时退回逐行匹配 '序号. 标准分类:xxx'
+    """
+    results = {}
+
+    for obj in re.finditer(r'\{[^{}]*\}', text):
+        try:
+            item = json.loads(obj.group(0))
+            idx = int(item.get('id', 0))
+        except (ValueError, TypeError, AttributeError):
+            continue
+        value = re.search(r'"标准分类"\s*:\s*"((?:[^"\\]|\\.)*)"', obj.group(0))
+        label = str(item.get('标准分类', '')).strip()
+        if 1 <= idx <= n and label and value:
+            results[idx] = (label, obj.start() + value.start(1), obj.start() + value.end(1))
+    if results:
+        return results
+
+    for m in re.finditer(r'^\s*(\d+)[.、:：]\s*(?:.*?标准分类[:：])?\s*(\S+)\s*$', text, flags=re.MULTILINE):
+        idx = int(m.group(1))
+        if 1 <= idx <= n:
+            results[idx] = (m.group(2), m.start(2), m.end(2))
+    return results
+
+
+def chunk_columns(tokenizer, items):
+    """按 token 预算和字段数上限把一张表的字段切块"""
+    chunks, current, used = [], [], 0
+    for item in items:
+        cost = len(tokenizer.encode(column_line(len(current) + 1, item[1]), add_special_tokens=False))
+        if current and (used + cost > TABLE_TOKEN_BUDGET or len(current) >= MAX_COLUMNS_PER_CALL):
+            chunks.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def classify_by_table(csv_file, step2_file=None):
+    if not os.path.exists(csv_file):
+        print(f"错误: 找不到文件 {csv_file}")
+        return
+
+    predicted_map = load_predicted_descs(step2_file) if step2_file else {}
+
+    model, tokenizer = load_model(
+        ckpt_dir,
+        device=DEVICE,
+        cpu_threads=CPU_THREADS,
+        quantize=CPU_QUANTIZE
+    )
+    print("模型加载成功！开始整表分类...")
+
+    site = site_name(csv_file)
+    csv_encoding = detect_encoding(csv_file)
+    with open(csv_file, 'r', encoding=csv_encoding, newline='') as f:
+        rows = list(csv.DictReader(f, delimiter=','))
+    total = len(rows)
+
+    # 1. 按 uri 分组 (保持首次出现顺序)；没有 uri 的行单独处理
+    tables = {}
+    singles = []
+    for i, row in enumerate(rows):
+        uri = row.get('uri', '').strip()
+        item = (i, build_classify_query(row, predicted_map), row)
+        if uri:
+            tables.setdefault(uri, []).append(item)
+        else:
+            singles.append(item)
+
+    calls = 0
+    table_rows = 0
+    fallback_rows = 0
+    done = 0
+
+    def write(f_out, item, response, label, confidence, mode, table_response=None):
+        i, query, row = item
+        record = {
+            "query": query,
+            "raw_data": row,
+            "site": site,
+            "response": response.strip(),
+            "标准分类": label,
+            "标准分类_置信度": round(confidence, 4),
+            "batch_mode": mode
+        }
+        if table_response is not None:
+            # 整表调用的原始输出，块内字段共用，排查解析问题时用
+            record["table_response"] = table_response
+        f_out.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def classify_single(f_out, item, mode):
+        nonlocal calls
+        response, _, confidence = generate_with_confidence(model, tokenizer, FINAL_SYSTEM_PROMPT, item[1],
+                                                           score_after=LABEL_MARKER)
+        calls += 1
+        _, label = parse_classify_response(response)
+        write(f_out, item, response, label, confidence, mode)
+
+    with open(output_file, 'w', encoding='utf-8') as f_out:
+        for uri, items in tables.items():
+            if len(items) < MIN_COLUMNS_PER_CALL:
+                singles.extend(items)
+                continue
+
+            for chunk in chunk_columns(tokenizer, items):
+                parsed, confidences, response = {}, {}, ''
+                try:
+                    query = build_table_query(uri, [item[1] for item in chunk])
+                    response, token_ids, token_logprobs = generate_answer(
+                        model, tokenizer, TABLE_SYSTEM_PROMPT, query,
+                        max_new_tokens=NEW_TOKENS_PER_COLUMN * len(chunk) + 32
+                    )
+                    calls += 1
+                    # 在答案文本上解析，字符偏移与答案 token 对齐，每个字段只对自己的标准分类打分
+                    answer = tokenizer.decode(token_ids, skip_special_tokens=True)
+                    parsed = parse_table_response(answer, len(chunk))
+                    spans = [(start, end) for _, start, end in parsed.values()]
+                    confidences = dict(zip(parsed, spans_confidence(tokenizer, token_ids, token_logprobs, spans)))
+                except Exception as e:
+                    print(f"Error table {uri}: {e}")
+
+                for idx, item in enumerate(chunk, start=1):
+                    try:
+                        if idx in parsed:
+                            label = parsed[idx][0]
+                            write(f_out, item, label, label, confidences[idx], 'table',
+                                  table_response=response)
+                            table_rows += 1
+                        else:
+                            # 解析失败的字段退回单字段请求
+                            classify_single(f_out, item, 'fallback')
+                            fallback_rows += 1
+                    except Exception as e:
+                        print(f"Error row {item[0]}: {e}")
+                f_out.flush()
+
+                done += len(chunk)
+                print(f"[{done}/{total}] {uri}: {len(chunk)} 个字段，解析成功 {len(parsed)} 个")
+
+        for item in singles:
+            try:
+                classify_single(f_out, item, 'single')
+            except Exception as e:
+                print(f"Error row {item[0]}: {e}")
+            done += 1
+
+    saved_per_1k = (total - calls) / total * 1000 if total else 0
+    print("=" * 50)
+    print("整表分类完成！")
+    print(f"字段总数: {total}，模型调用次数: {calls}")
+    print(f"    整表打包成功: {table_rows} 个字段")
+    print(f"    解析失败回退单字段: {fallback_rows} 个字段")
+    print(f"    单字段 (无表名或表太小): {len(singles)} 个字段")
+    print(f"每 1000 个字段节省调用: {saved_per_1k:.0f} 次")
+    print(f"输出文件: {output_file}")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("使用方法: python table_batch_classify.py <原始CSV> [Step2补全文件]")
+    else:
+        classify_by_table(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)